@@ -3,6 +3,7 @@
 #
 """This module implements a generic but naive approach to approximate the query span. A system integration will be much more efficient."""
 import queue
+from collections import defaultdict
 from multiprocessing.pool import ThreadPool as Pool
 import numpy as np
 import storage
@@ -124,10 +125,12 @@ def approximate_query_span(connector_type, sql_query: str, get_json_query_plan,
     return query_span
 
 
-def serialize_dependencies(query_path: str, hint_set: HintSet):
-    if hint_set.dependencies is not None:
-        for knob in hint_set.dependencies.get_all_knobs():
-            storage.register_optimizer_dependency(query_path, ','.join(sorted(hint_set.knobs)), knob)
+def get_dependency_rows(query_path: str, hint_set: HintSet) -> list[dict]:
+    """Rows for storage.register_optimizer_dependencies describing the dependencies of a hint-set"""
+    if hint_set.dependencies is None:
+        return []
+    optimizer = ','.join(sorted(hint_set.knobs))
+    return [{'query_path': query_path, 'optimizer': optimizer, 'dependency': knob} for knob in hint_set.dependencies.get_all_knobs()]
 
 
 def run_get_query_span(connector_type, benchmark, query):
@@ -139,10 +142,13 @@ def run_get_query_span(connector_type, benchmark, query):
     query_span = approximate_query_span(connector_type, sql, get_query_plan, find_alternative_knobs=True, batch_wise=False)
 
     # Serialize the approximated query span in the database
+    optimizers, dependencies = [], []
     for optimizer in query_span:  # pylint: disable=not-an-iterable
         logger.info('Found new hint-set: %s', optimizer)
-        storage.register_optimizer(query_path, ','.join(sorted(optimizer.knobs)), optimizer.required)
-        serialize_dependencies(query_path, optimizer)
+        optimizers.append({'query_path': query_path, 'optimizer': ','.join(sorted(optimizer.knobs)), 'required': optimizer.required})
+        dependencies.extend(get_dependency_rows(query_path, optimizer))
+    storage.register_optimizers(optimizers)
+    storage.register_optimizer_dependencies(dependencies)
 
 
 class QuerySpan:
@@ -153,17 +159,14 @@ class QuerySpan:
             self.query_path = query_path
             self.effective_optimizers = storage.get_effective_optimizers(self.query_path)
             self.required_optimizers = storage.get_required_optimizers(self.query_path)
-            self.dependencies = {}
-            self._get_dependencies()
+            self.dependencies = self._get_dependencies()
 
     def _get_dependencies(self):
         """Alternative optimizers become only effective if their dependencies are also disabled"""
-        dependencies = storage.get_effective_optimizers_depedencies(self.query_path)
-        for optimizer, dependency in dependencies:
-            if optimizer in self.dependencies:
-                self.dependencies[optimizer].append(dependency)
-            else:
-                self.dependencies[optimizer] = [dependency]
+        dependencies = defaultdict(list)
+        for optimizer, dependency in storage.get_effective_optimizers_depedencies(self.query_path):
+            dependencies[optimizer].append(dependency)
+        return dict(dependencies)  # callers check membership, so avoid inserting keys on lookup
 
     def get_tunable_knobs(self):
         return sorted(list(set(self.effective_optimizers).difference(self.required_optimizers)))
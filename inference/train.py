@@ -6,6 +6,7 @@ import os
 import storage
 import numpy as np
 import pickle
+from collections import defaultdict
 from matplotlib import pyplot as plt
 
 from inference.performance_prediction import PerformancePrediction
@@ -111,12 +112,9 @@ def _choose_best_plans(query_plan_preprocessor, filename: str, test_configs: lis
     bao_model.load(filename)
 
     # load query plans for prediction
-    all_query_plans = {}
+    all_query_plans = defaultdict(list)
     for plan_runtime in test_configs:
-        if plan_runtime.query_id in all_query_plans:
-            all_query_plans[plan_runtime.query_id].append(plan_runtime)
-        else:
-            all_query_plans[plan_runtime.query_id] = [plan_runtime]
+        all_query_plans[plan_runtime.query_id].append(plan_runtime)
 
     performance_predictions: list[PerformancePrediction] = []
 
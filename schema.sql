@@ -10,7 +10,8 @@ CREATE TABLE IF NOT EXISTS queries
     id                 INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL ,
     benchmark_id       INTEGER REFERENCES benchmarks NOT NULL,
     query_path         varchar(256) NOT NULL,
-    result_fingerprint INTEGER DEFAULT 0
+    result_fingerprint INTEGER DEFAULT 0,
+    benchmark          varchar(256) -- directory of query_path, set by trigger set_query_benchmark
 );
 --------------------------------------------------------------------------------
 CREATE TABLE IF NOT EXISTS query_required_optimizers
@@ -57,4 +58,101 @@ CREATE TABLE IF NOT EXISTS measurements
     input_data_size           INTEGER NOT NULL,
     num_compute_nodes         INTEGER NOT NULL
 );
+--------------------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS default_plan_runtime
+(
+    query_path VARCHAR(256) PRIMARY KEY NOT NULL,
+    walltime   REAL NOT NULL -- median walltime of the default plan (no disabled rules)
+);
+--------------------------------------------------------------------------------
+-- backfill databases created before the table existed
+INSERT INTO default_plan_runtime (query_path, walltime)
+SELECT q.query_path, median(m.walltime)
+FROM queries q, query_optimizer_configs qoc, measurements m
+WHERE q.id = qoc.query_id
+  AND qoc.id = m.query_optimizer_config_id
+  AND qoc.num_disabled_rules = 0
+  AND qoc.disabled_rules = 'None'
+  AND NOT EXISTS (SELECT 1 FROM default_plan_runtime)
+GROUP BY q.query_path;
+--------------------------------------------------------------------------------
+-- The triggers below keep default_plan_runtime in sync with measurements of default plans. They call median(), which is provided
+-- by the sqlean stats extension (sqlean-extensions/stats.so): connections without the extension loaded, e.g., the sqlite3 CLI,
+-- cannot insert, update, or delete measurements. Load it first, e.g., '.load ./sqlean-extensions/stats' in the CLI.
+CREATE TRIGGER IF NOT EXISTS update_default_plan_runtime
+    AFTER INSERT ON measurements
+    WHEN EXISTS (SELECT 1 FROM query_optimizer_configs WHERE id = NEW.query_optimizer_config_id AND num_disabled_rules = 0 AND disabled_rules = 'None')
+BEGIN
+    DELETE FROM default_plan_runtime WHERE query_path = (SELECT qu.query_path FROM queries qu, query_optimizer_configs c WHERE c.id = NEW.query_optimizer_config_id AND qu.id = c.query_id);
+    INSERT INTO default_plan_runtime (query_path, walltime)
+    SELECT q.query_path, median(m.walltime)
+    FROM queries q, query_optimizer_configs qoc, measurements m
+    WHERE q.id = qoc.query_id
+      AND qoc.id = m.query_optimizer_config_id
+      AND qoc.num_disabled_rules = 0
+      AND qoc.disabled_rules = 'None'
+      AND q.query_path = (SELECT qu.query_path FROM queries qu, query_optimizer_configs c WHERE c.id = NEW.query_optimizer_config_id AND qu.id = c.query_id)
+    GROUP BY q.query_path;
+END;
+--------------------------------------------------------------------------------
+CREATE TRIGGER IF NOT EXISTS update_default_plan_runtime_on_delete
+    AFTER DELETE ON measurements
+    WHEN EXISTS (SELECT 1 FROM query_optimizer_configs WHERE id = OLD.query_optimizer_config_id AND num_disabled_rules = 0 AND disabled_rules = 'None')
+BEGIN
+    DELETE FROM default_plan_runtime WHERE query_path = (SELECT qu.query_path FROM queries qu, query_optimizer_configs c WHERE c.id = OLD.query_optimizer_config_id AND qu.id = c.query_id);
+    INSERT INTO default_plan_runtime (query_path, walltime)
+    SELECT q.query_path, median(m.walltime)
+    FROM queries q, query_optimizer_configs qoc, measurements m
+    WHERE q.id = qoc.query_id
+      AND qoc.id = m.query_optimizer_config_id
+      AND qoc.num_disabled_rules = 0
+      AND qoc.disabled_rules = 'None'
+      AND q.query_path = (SELECT qu.query_path FROM queries qu, query_optimizer_configs c WHERE c.id = OLD.query_optimizer_config_id AND qu.id = c.query_id)
+    GROUP BY q.query_path;
+END;
+--------------------------------------------------------------------------------
+CREATE TRIGGER IF NOT EXISTS update_default_plan_runtime_on_update
+    AFTER UPDATE ON measurements
+    WHEN EXISTS (SELECT 1 FROM query_optimizer_configs WHERE id = OLD.query_optimizer_config_id AND num_disabled_rules = 0 AND disabled_rules = 'None') OR EXISTS (SELECT 1 FROM query_optimizer_configs WHERE id = NEW.query_optimizer_config_id AND num_disabled_rules = 0 AND disabled_rules = 'None')
+BEGIN
+    DELETE FROM default_plan_runtime WHERE query_path = (SELECT qu.query_path FROM queries qu, query_optimizer_configs c WHERE c.id = OLD.query_optimizer_config_id AND qu.id = c.query_id);
+    INSERT INTO default_plan_runtime (query_path, walltime)
+    SELECT q.query_path, median(m.walltime)
+    FROM queries q, query_optimizer_configs qoc, measurements m
+    WHERE q.id = qoc.query_id
+      AND qoc.id = m.query_optimizer_config_id
+      AND qoc.num_disabled_rules = 0
+      AND qoc.disabled_rules = 'None'
+      AND q.query_path = (SELECT qu.query_path FROM queries qu, query_optimizer_configs c WHERE c.id = OLD.query_optimizer_config_id AND qu.id = c.query_id)
+    GROUP BY q.query_path;
+    DELETE FROM default_plan_runtime WHERE query_path = (SELECT qu.query_path FROM queries qu, query_optimizer_configs c WHERE c.id = NEW.query_optimizer_config_id AND qu.id = c.query_id);
+    INSERT INTO default_plan_runtime (query_path, walltime)
+    SELECT q.query_path, median(m.walltime)
+    FROM queries q, query_optimizer_configs qoc, measurements m
+    WHERE q.id = qoc.query_id
+      AND qoc.id = m.query_optimizer_config_id
+      AND qoc.num_disabled_rules = 0
+      AND qoc.disabled_rules = 'None'
+      AND q.query_path = (SELECT qu.query_path FROM queries qu, query_optimizer_configs c WHERE c.id = NEW.query_optimizer_config_id AND qu.id = c.query_id)
+    GROUP BY q.query_path;
+END;
+--------------------------------------------------------------------------------
+CREATE INDEX IF NOT EXISTS idx_queries_path ON queries (query_path);
+CREATE INDEX IF NOT EXISTS idx_qoc_qid_hash ON query_optimizer_configs (query_id, hash, disabled_rules);
+CREATE INDEX IF NOT EXISTS idx_m_qoc ON measurements (query_optimizer_config_id);
+CREATE INDEX IF NOT EXISTS idx_queries_benchmark ON queries (benchmark);
+--------------------------------------------------------------------------------
+-- the benchmark is everything before the last '/' of the query path
+CREATE TRIGGER IF NOT EXISTS set_query_benchmark
+    AFTER INSERT ON queries
+    WHEN NEW.benchmark IS NULL
+BEGIN
+    UPDATE queries SET benchmark = rtrim(rtrim(NEW.query_path, replace(NEW.query_path, '/', '')), '/') WHERE id = NEW.id;
+END;
+--------------------------------------------------------------------------------
+UPDATE queries SET benchmark = rtrim(rtrim(query_path, replace(query_path, '/', '')), '/') WHERE benchmark IS NULL;
+--------------------------------------------------------------------------------
+-- refresh planner statistics so the indexes are used; analysis_limit keeps this cheap on large databases
+PRAGMA analysis_limit = 1000;
+ANALYZE;
 --------------------------------------------------------------------------------
\ No newline at end of file
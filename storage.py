@@ -2,17 +2,23 @@
 # SPDX-License-Identifier: MIT
 #
 """This module implements the connection to the SQLite3 database persisting all benchmarking data generated by AutoSteer"""
-import json
+import atexit
+import functools
 import numpy as np
+import orjson
 import pandas as pd
+import queue
 import random
 import socket
 import sys
 import os
+import threading
+import time
 from datetime import datetime
+from typing import Iterable
 from sqlalchemy import create_engine, event
 from sqlalchemy.sql import text
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import QueuePool
 import unittest
 
 from utils.custom_logging import logger
@@ -20,98 +26,217 @@ from utils.util import read_sql_file
 
 SCHEMA_FILE = 'schema.sql'
 ENGINE = None
+_ENGINE_LOCK = threading.Lock()
+_SCHEMA_INITIALIZED = False
+# measurements are queued and written in batches by a background thread, see register_measurements()
+_WRITE_Q = queue.Queue()
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+_WRITER_ERRORS = queue.Queue()
+WRITE_BATCH_SIZE = 128
+WRITE_BATCH_TIMEOUT = 0.05
 TESTED_DATABASE = None
 BENCHMARK_ID = None
+# Per-connection settings: write to the WAL and skip the fsync after every autocommitted insert
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-65536',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA foreign_keys=ON',
+]
+
+READ_SQL_CHUNKSIZE = 10_000
+CATEGORICAL_COLUMNS = {'query_path', 'disabled_rules'}
+STREAM_ROW_BUFFER = 1000
+
+# SQL statements are compiled once at module load; per-table variants are precomputed instead of formatted per call
+_STMT_REGISTER_BENCHMARK = text('INSERT OR IGNORE INTO benchmarks (name) VALUES (:name)')
+_STMT_GET_BENCHMARK_ID = text('SELECT benchmarks.id FROM benchmarks WHERE name=:name')
+_STMT_REGISTER_QUERY = text('INSERT OR IGNORE INTO queries (benchmark_id, query_path, result_fingerprint) '
+                            'VALUES (:benchmark_id, :query_path, :result_fingerprint)')
+_STMT_REGISTER_OPTIMIZER = {table: text(f'INSERT OR IGNORE INTO {table} (query_id, optimizer) '
+                                        'SELECT id, :optimizer FROM queries WHERE query_path = :query_path')
+                            for table in ['query_effective_optimizers', 'query_required_optimizers']}
+_STMT_REGISTER_OPTIMIZER_DEPENDENCY = text('INSERT OR IGNORE INTO query_effective_optimizers_dependencies (query_id, optimizer, dependent_optimizer) '
+                                           'SELECT id, :optimizer, :dependency FROM queries WHERE query_path = :query_path')
+_STMT_REGISTER_MEASUREMENT = text("""
+                INSERT INTO measurements (query_optimizer_config_id, walltime, machine, time, input_data_size, num_compute_nodes)
+                SELECT id, :walltime, :host, :time, :input_data_size, :nodes FROM query_optimizer_configs
+                WHERE query_id = (SELECT id FROM queries WHERE query_path = :query_path) AND disabled_rules = :disabled_rules
+                """)
+_STMT_REGISTER_QUERY_FINGERPRINT = text('UPDATE queries SET result_fingerprint = COALESCE(result_fingerprint, :fingerprint) WHERE query_path = :query_path '
+                                        'RETURNING result_fingerprint = :fingerprint')
+_OPTIMIZER_PROJECTIONS = {
+    'query_required_optimizers': ['optimizer'],
+    'query_effective_optimizers': ['optimizer'],
+    'query_effective_optimizers_dependencies': ['optimizer', 'dependent_optimizer'],
+}
+_STMT_GET_OPTIMIZERS = {table: text(f"""
+               SELECT {','.join(projections)}
+               FROM queries q, {table} qro
+               WHERE q.query_path=:query_path AND q.id = qro.query_id AND optimizer != ''
+               """) for table, projections in _OPTIMIZER_PROJECTIONS.items()}
+# Statements filtering by benchmark are keyed by whether a benchmark is given; separate statements keep idx_queries_benchmark usable
+_BENCHMARK_FILTER = {True: 'AND qu.benchmark = :benchmark', False: ''}
+# grouping by q.id alone is sufficient as all other columns depend on it, and avoids sorting by the plan text
+_STMT_EXPERIENCE = {filtered: text(f"""SELECT qu.query_path, q.query_id, q.id,  q.disabled_rules, q.num_disabled_rules, q.query_plan,
+                   median(walltime) AS walltime
+            FROM measurements m, query_optimizer_configs q, queries qu
+            WHERE m.query_optimizer_config_id = q.id
+              AND q.query_plan != 'None'
+              AND qu.id = q.query_id
+              {_BENCHMARK_FILTER[filtered]}
+            group by q.id""") for filtered in [True, False]}
+_CHECK_FOR_DUPLICATED_PLANS = """SELECT count(*) > 0
+                    FROM queries q, query_optimizer_configs qoc
+                    WHERE q.id = qoc.query_id
+                      AND q.query_path = :query_path
+                      AND qoc.hash = :plan_hash
+                      AND qoc.disabled_rules != :disabled_rules"""
+_STMT_CHECK_FOR_DUPLICATED_PLANS = text(_CHECK_FOR_DUPLICATED_PLANS)
+# The duplicate check and the insert run as one statement; an already registered config is left untouched and returns no row
+_STMT_REGISTER_QUERY_CONFIG = text(f"""WITH dup (is_duplicate) AS ({_CHECK_FOR_DUPLICATED_PLANS})
+                   INSERT INTO query_optimizer_configs
+                   (query_id, disabled_rules, query_plan, num_disabled_rules, hash, duplicated_plan)
+                   SELECT q.id, :disabled_rules, :query_plan_processed , :num_disabled_rules, :plan_hash, dup.is_duplicate
+                   FROM queries q, dup
+                   WHERE q.query_path = :query_path
+                     AND NOT EXISTS (SELECT 1 FROM query_optimizer_configs c WHERE c.query_id = q.id AND c.disabled_rules = :disabled_rules)
+                   ON CONFLICT (query_id, disabled_rules) DO NOTHING
+                   RETURNING duplicated_plan
+                   """)
+_STMT_MEDIAN_RUNTIMES = text("""SELECT q.query_path, qoc.num_disabled_rules, qoc.disabled_rules, qoc.query_plan, median(m.walltime)
+        FROM queries q,  query_optimizer_configs qoc, measurements m
+        WHERE q.id = qoc.query_id AND qoc.id = m.query_optimizer_config_id
+        GROUP BY q.query_path, qoc.num_disabled_rules, qoc.disabled_rules, qoc.query_plan
+        """)
+_STMT_BEST_ALTERNATIVE_CONFIGURATION = {filtered: text(read_sql_file('best_alternative_queries.sql').format(benchmark_filter=_BENCHMARK_FILTER[filtered]))
+                                        for filtered in [True, False]}
+_SCHEMA = read_sql_file(SCHEMA_FILE)
+_STMT_CHECK_FOR_EXISTING_MEASUREMENTS = text("""SELECT count(*) as num_measurements
+                FROM measurements m, query_optimizer_configs qoc, queries q
+                WHERE m.query_optimizer_config_id = qoc.id
+                AND qoc.query_id = q.id
+                AND q.query_path = :query_path
+                AND qoc.disabled_rules = :disabled_rules
+             """)
 
 
-def _db():
-    global ENGINE
-    url = f'sqlite:///results/{TESTED_DATABASE}.sqlite'
-    logger.debug('Connect to database: %s', url)
-    ENGINE = create_engine(url)
+def _benchmark(benchmark):
+    """Normalize the benchmark directory to the value stored in queries.benchmark"""
+    return None if benchmark is None else benchmark.rstrip('/')
 
-    @event.listens_for(ENGINE, 'connect')
-    def connect(dbapi_conn, _):
-        """Load SQLite extension for median calculation"""
-        extension_path = './sqlean-extensions/stats.so'
 
-        if not os.path.isfile(extension_path):
-            logger.fatal('Please, first download the required sqlite3 extension using sqlean-extensions/download.sh')
-            sys.exit(1)
+def _connect(dbapi_conn, _):
+    """Load SQLite extension for median calculation and apply the connection pragmas"""
+    extension_path = './sqlean-extensions/stats.so'
 
-        dbapi_conn.enable_load_extension(True)
-        dbapi_conn.load_extension(extension_path)
-        dbapi_conn.enable_load_extension(False)
+    if not os.path.isfile(extension_path):
+        logger.fatal('Please, first download the required sqlite3 extension using sqlean-extensions/download.sh')
+        sys.exit(1)
 
-    conn = ENGINE.connect()
-    schema = read_sql_file(SCHEMA_FILE)
+    dbapi_conn.enable_load_extension(True)
+    dbapi_conn.load_extension(extension_path)
+    dbapi_conn.enable_load_extension(False)
 
-    for statement in schema.split(';'):
-        if len(statement.strip()) > 0:
-            try:
-                conn.execute(statement)
-            except Exception as e:
-                print(e)
-                raise e
-    return conn
+    for pragma in SQLITE_PRAGMAS:
+        dbapi_conn.execute(pragma)
+
+
+def _init_schema(engine):
+    """Create all tables in a single executescript call; runs at most once"""
+    global _SCHEMA_INITIALIZED
+    if _SCHEMA_INITIALIZED:
+        return
+    dbapi_conn = engine.raw_connection()
+    try:
+        cursor = dbapi_conn.cursor()
+        # databases created before queries.benchmark existed; schema.sql backfills the values
+        columns = [column[1] for column in cursor.execute('PRAGMA table_info(queries)')]
+        if len(columns) > 0 and 'benchmark' not in columns:
+            cursor.execute('ALTER TABLE queries ADD COLUMN benchmark VARCHAR(256)')
+        cursor.executescript(_SCHEMA)
+    finally:
+        dbapi_conn.close()
+    _SCHEMA_INITIALIZED = True
+
+
+def _engine():
+    """Return the process-wide engine; connections are checked out of its pool instead of being reopened per call"""
+    global ENGINE
+    with _ENGINE_LOCK:
+        if ENGINE is None:
+            url = f'sqlite:///results/{TESTED_DATABASE}.sqlite'
+            logger.debug('Connect to database: %s', url)
+            # pooled connections may be handed to a different thread than the one that opened them
+            engine = create_engine(url, poolclass=QueuePool, pool_size=5, max_overflow=10, connect_args={'check_same_thread': False, 'cached_statements': 256})
+            # fires once per new DBAPI connection in the pool, i.e., the extension is loaded at most pool_size + max_overflow times
+            event.listen(engine, 'connect', _connect)
+            _init_schema(engine)
+            with engine.connect() as conn:
+                conn.execute('SELECT median(1)')  # fail early if the stats extension is not available
+            ENGINE = engine
+    return ENGINE
 
 
 def register_benchmark(name: str) -> int:
     # Register a new benchmark and return its id
-    with _db() as conn:
-        try:
-            stmt = text('INSERT INTO benchmarks (name) VALUES (:name)')
-            conn.execute(stmt, name=name)
-        except IntegrityError:
-            pass
-        return conn.execute('SELECT benchmarks.id FROM benchmarks WHERE name=:name', name=name).fetchone()[0]
+    with _engine().begin() as conn:
+        conn.execute(_STMT_REGISTER_BENCHMARK, name=name)
+        return conn.execute(_STMT_GET_BENCHMARK_ID, name=name).fetchone()[0]
+
+
+def _execute_many(stmt, rows):
+    """Insert all rows using a single executemany inside one transaction"""
+    rows = list(rows)
+    if len(rows) > 0:
+        with _engine().begin() as conn:
+            conn.execute(stmt, rows)
+
+
+def register_queries(query_paths: Iterable[str]):
+    # Register new queries
+    _execute_many(_STMT_REGISTER_QUERY, [{'benchmark_id': BENCHMARK_ID, 'query_path': query_path, 'result_fingerprint': None} for query_path in query_paths])
+    invalidate_optimizer_cache()
 
 
 def register_query(query_path):
     # Register a new query
-    with _db() as conn:
-        try:
-            stmt = text('INSERT INTO queries (benchmark_id, query_path, result_fingerprint) VALUES (:benchmark_id, :query_path, :result_fingerprint )')
-            conn.execute(stmt, benchmark_id=BENCHMARK_ID, query_path=query_path, result_fingerprint=None)
-        except IntegrityError:
-            pass
+    register_queries([query_path])
 
 
 def register_query_fingerprint(query_path, fingerprint):
-    with _db() as conn:
-        result = conn.execute(text('SELECT result_fingerprint FROM queries WHERE query_path= :query_path'), query_path=query_path).fetchone()[0]
-        if result is None:
-            conn.execute(text('UPDATE queries SET result_fingerprint = :fingerprint WHERE query_path = :query_path;'),
-                         fingerprint=fingerprint, query_path=query_path)
-            return True
-        elif result != fingerprint:
-            return False  # fingerprints do not match
-        return True
+    """Store the fingerprint if the query has none yet; returns False if it does not match the existing fingerprint"""
+    with _engine().begin() as conn:
+        return bool(conn.execute(_STMT_REGISTER_QUERY_FINGERPRINT, fingerprint=fingerprint, query_path=query_path).scalar())
+
+
+def register_optimizers(rows: Iterable[dict]):
+    """Register hint-sets given as dicts with the keys query_path, optimizer, and required; duplicates are ignored"""
+    rows = list(rows)
+    _execute_many(_STMT_REGISTER_OPTIMIZER['query_effective_optimizers'], [row for row in rows if not row['required']])
+    _execute_many(_STMT_REGISTER_OPTIMIZER['query_required_optimizers'], [row for row in rows if row['required']])
+    invalidate_optimizer_cache()
 
 
 def register_optimizer(query_path, optimizer, required: bool):
-    with _db() as conn:
-        try:
-            table = 'query_effective_optimizers' if not required else 'query_required_optimizers'
-            stmt = text(f'INSERT INTO {table} (query_id, optimizer) '
-                        'SELECT id, :optimizer FROM queries WHERE query_path = :query_path')
-            conn.execute(stmt, table=table, optimizer=optimizer, query_path=query_path)
-        except IntegrityError:
-            pass  # do not store duplicates
+    register_optimizers([{'query_path': query_path, 'optimizer': optimizer, 'required': required}])
+
+
+def register_optimizer_dependencies(rows: Iterable[dict]):
+    """Register dependencies given as dicts with the keys query_path, optimizer, and dependency; duplicates are ignored"""
+    _execute_many(_STMT_REGISTER_OPTIMIZER_DEPENDENCY, rows)
+    invalidate_optimizer_cache()
 
 
 def register_optimizer_dependency(query_path, optimizer, dependency):
-    with _db() as conn:
-        try:
-            stmt = text('INSERT INTO query_effective_optimizers_dependencies (query_id, optimizer, dependent_optimizer) '
-                        'SELECT id, :optimizer, :dependency FROM queries WHERE query_path = :query_path')
-            conn.execute(stmt, optimizer=optimizer, dependency=dependency, query_path=query_path)
-        except IntegrityError:
-            pass  # do not store duplicates
+    register_optimizer_dependencies([{'query_path': query_path, 'optimizer': optimizer, 'dependency': dependency}])
 
 
 class Measurement:
-    """This class stores the measurement for a certain query and optimizer configuration"""
+    """This class stores the measurement for a certain query and optimizer configuration; plan_json is the already decoded plan"""
 
     def __init__(self, query_path, query_id, optimizer_config, disabled_rules, num_disabled_rules, plan_json, walltime):
         self.query_path = query_path
@@ -119,32 +244,57 @@ class Measurement:
         self.optimizer_config = optimizer_config
         self.disabled_rules = disabled_rules
         self.num_disabled_rules = num_disabled_rules
-        self.plan_json = json.loads(plan_json)
+        self.plan_json = plan_json
         self.walltime = walltime
 
 
-def experience(benchmark=None, training_ratio=0.8):
-    """Get experience to train a neural network"""
-    stmt = """SELECT qu.query_path, q.query_id, q.id,  q.disabled_rules, q.num_disabled_rules, q.query_plan, median(walltime)
-            FROM measurements m, query_optimizer_configs q, queries qu
-            WHERE m.query_optimizer_config_id = q.id
-              AND q.query_plan != 'None' 
-              AND qu.id = q.query_id
-              AND qu.query_path like :benchmark
-            group by qu.query_path, q.query_id, q.id, q.disabled_rules, q.num_disabled_rules, q.query_plan"""
+def _downcast(df):
+    """Shrink integer and float columns to the smallest dtype that holds their values"""
+    for column in df.select_dtypes(include=np.integer).columns:
+        df[column] = pd.to_numeric(df[column], downcast='unsigned')
+        if df[column].dtype == np.int64:  # negative values
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+    for column in df.select_dtypes(include=np.floating).columns:
+        df[column] = pd.to_numeric(df[column], downcast='float')
+    return df
+
+
+def _convert(df, converters):
+    for column, converter in converters.items():
+        df[column] = df[column].map(converter)
+    return df
+
 
-    with _db() as conn:
-        benchmark = '%%' if benchmark is None else '%%' + benchmark + '%%'
-        df = pd.read_sql(stmt, conn, params={'benchmark': benchmark})
-    rows = [Measurement(*row) for index, row in df.iterrows()]
+def _read_sql(stmt, conn, params=None, converters=None):
+    """Read a query result chunk-wise into a DataFrame with downcasted numeric and categorical columns.
+    converters maps columns to functions applied per chunk, so the raw values of a chunk are released before the next one is read."""
+    chunks = pd.read_sql(stmt, conn, params=params, chunksize=READ_SQL_CHUNKSIZE)
+    df = pd.concat([_convert(_downcast(chunk), converters or {}) for chunk in chunks], ignore_index=True)
+    # low-cardinality columns; converted after concat, as chunks would have differing categories
+    for column in CATEGORICAL_COLUMNS.intersection(df.columns):
+        df[column] = df[column].astype('category')
+    return df
+
+
+def _to_measurements(groups, keys):
+    """Fill one preallocated object array with the Measurements of the given query groups"""
+    measurements = np.empty(sum(len(groups[key]) for key in keys), dtype=object)
+    i = 0
+    for key in keys:
+        for row in groups[key].itertuples(index=False, name=None):
+            measurements[i] = Measurement(*row)
+            i += 1
+    return measurements
+
+
+def experience(benchmark=None, training_ratio=0.8):
+    """Get experience to train a neural network; benchmark is the directory containing the queries, None selects all"""
+    flush_measurements()
+    with _engine().connect() as conn:
+        df = _read_sql(_STMT_EXPERIENCE[benchmark is not None], conn, params={'benchmark': _benchmark(benchmark)}, converters={'query_plan': orjson.loads})
 
     # Group training and test data by query
-    result = {}
-    for row in rows:
-        if row.query_id in result:
-            result[row.query_id].append(row)
-        else:
-            result[row.query_id] = [row]
+    result = dict(tuple(df.groupby('query_id')))
 
     keys = list(result.keys())
     random.shuffle(keys)
@@ -152,45 +302,47 @@ def experience(benchmark=None, training_ratio=0.8):
     train_keys = keys[:split_index]
     test_keys = keys[split_index:]
 
-    train_data = np.concatenate([result[key] for key in train_keys])
-    test_data = np.concatenate([result[key] for key in test_keys])
+    train_data = _to_measurements(result, train_keys)
+    test_data = _to_measurements(result, test_keys)
 
     return train_data, test_data
 
 
-def _get_optimizers(table_name, query_path, projections):
-    """No SQL injections as this is a private function only called from within *this* module"""
-    with _db() as conn:
-        stmt = f"""
-               SELECT {','.join(projections)}
-               FROM queries q, {table_name} qro
-               WHERE q.query_path=:query_path AND q.id = qro.query_id AND optimizer != ''
-               """
-        cursor = conn.execute(stmt, query_path=query_path)
-        return cursor.fetchall()
+@functools.lru_cache(maxsize=4096)
+def _get_optimizers(table_name, query_path):
+    """Fetch the optimizers of a query from one of the tables in _OPTIMIZER_PROJECTIONS; results are cached until invalidate_optimizer_cache()"""
+    with _engine().connect() as conn:
+        cursor = conn.execute(_STMT_GET_OPTIMIZERS[table_name], query_path=query_path)
+        return tuple(tuple(row) for row in cursor.fetchall())
+
+
+def invalidate_optimizer_cache():
+    """Drop cached optimizer lookups; the register_* helpers call this after they modified the optimizer tables"""
+    _get_optimizers.cache_clear()
 
 
 def get_required_optimizers(query_path):
-    return list(map(lambda res: res[0], _get_optimizers('query_required_optimizers', query_path, ['optimizer'])))
+    return list(map(lambda res: res[0], _get_optimizers('query_required_optimizers', query_path)))
 
 
 def get_effective_optimizers(query_path):
-    return list(map(lambda res: res[0], _get_optimizers('query_effective_optimizers', query_path, ['optimizer'])))
+    return list(map(lambda res: res[0], _get_optimizers('query_effective_optimizers', query_path)))
 
 
 def get_effective_optimizers_depedencies(query_path):
-    return list(map(lambda res: [res[0], res[1]], _get_optimizers('query_effective_optimizers_dependencies', query_path, ['optimizer', 'dependent_optimizer'])))
+    return list(map(lambda res: [res[0], res[1]], _get_optimizers('query_effective_optimizers_dependencies', query_path)))
 
 
 def get_df(query, params):
-    with _db() as conn:
+    flush_measurements()
+    with _engine().connect() as conn:
         df = pd.read_sql(query, conn, params=params)
         return df
 
 
 def select_query(query, params):
-    with _db() as conn:
-        cursor = conn.execute(query, *params)
+    with _engine().connect() as conn:
+        cursor = conn.execute(query, params)
         return [row[0] for row in cursor.fetchall()]
 
 
@@ -199,57 +351,95 @@ def register_query_config(query_path, disabled_rules, query_plan: dict, plan_has
     Store the passed query optimizer configuration in the database.
     :returns: query plan is already known and a duplicate
     """
-    check_for_duplicated_plans = """SELECT count(*)
-        FROM queries q, query_optimizer_configs qoc
-        WHERE q.id = qoc.query_id
-              AND q.query_path = :query_path
-              AND qoc.hash = :plan_hash
-              AND qoc.disabled_rules != :disabled_rules"""
-    result = select_query(check_for_duplicated_plans, {query_path: query_path, plan_hash: plan_hash, disabled_rules: disabled_rules})
-    is_duplicate = result[0] > 0
-
-    with _db() as conn:
-        try:
-            num_disabled_rules = 0 if disabled_rules is None else disabled_rules.count(',') + 1
-            stmt = f"""INSERT INTO query_optimizer_configs
-                   (query_id, disabled_rules, query_plan, num_disabled_rules, hash, duplicated_plan) 
-                   SELECT id, :disabled_rules, :query_plan_processed , :num_disabled_rules, :plan_hash, :is_duplicate FROM queries WHERE query_path = '{query_path}'
-                   """
-            conn.execute(stmt, disabled_rules=str(disabled_rules), query_plan_processed=query_plan, num_disabled_rules=num_disabled_rules,
-                         plan_hash=plan_hash, is_duplicate=is_duplicate)
-        except IntegrityError:
-            pass  # OK! Query configuration has already been inserted
+    num_disabled_rules = 0 if disabled_rules is None else disabled_rules.count(',') + 1
+    params = {'disabled_rules': str(disabled_rules), 'query_plan_processed': query_plan, 'num_disabled_rules': num_disabled_rules,
+              'plan_hash': plan_hash, 'query_path': query_path}
+    with _engine().begin() as conn:
+        inserted = conn.execute(_STMT_REGISTER_QUERY_CONFIG, params).first()
+        if inserted is not None:
+            return bool(inserted[0])
+        # OK! Query configuration has already been inserted
+        return bool(conn.execute(_STMT_CHECK_FOR_DUPLICATED_PLANS, params).scalar())
+
 
-    return is_duplicate
+@functools.lru_cache(maxsize=4096)
+def _check_for_existing_measurements(query_path, disabled_rules):
+    with _engine().connect() as conn:
+        return conn.execute(_STMT_CHECK_FOR_EXISTING_MEASUREMENTS, query_path=query_path, disabled_rules=disabled_rules).scalar() > 0
 
 
 def check_for_existing_measurements(query_path, disabled_rules):
-    query = """SELECT count(*) as num_measurements
-                FROM measurements m, query_optimizer_configs qoc, queries q
-                WHERE m.query_optimizer_config_id = qoc.id
-                AND qoc.query_id = q.id
-                AND q.query_path = :query_path
-                AND qoc.disabled_rules = :disabled_rules
-             """
-    df = get_df(query, {'query_path': query_path, 'disabled_rules': disabled_rules})
-    values = df['num_measurements']
-    return values[0] > 0
+    flush_measurements()
+    return _check_for_existing_measurements(query_path, disabled_rules)
+
+
+def register_measurements(rows: Iterable[dict]):
+    """Queue measurements given as dicts with the keys query_path, disabled_rules, walltime, input_data_size, and nodes.
+    They are written asynchronously; the read helpers call flush_measurements() first."""
+    host = socket.gethostname()
+    measurements = []
+    for row in rows:
+        logger.info('Serialize a new measurement for query %s and the disabled knobs [%s]', row['query_path'], row['disabled_rules'])
+        measurements.append({'walltime': row['walltime'], 'host': host, 'time': datetime.now().strftime('%m/%d/%y, %h:%m:%s'),
+                             'input_data_size': row['input_data_size'], 'nodes': row['nodes'], 'query_path': row['query_path'],
+                             'disabled_rules': str(row['disabled_rules'])})
+    _start_measurement_writer()
+    for measurement in measurements:
+        _WRITE_Q.put(measurement)
+
+
+def _measurement_writer():
+    """Drain the queue and write up to WRITE_BATCH_SIZE measurements, or those queued within WRITE_BATCH_TIMEOUT seconds, per transaction"""
+    while True:
+        rows = [_WRITE_Q.get()]
+        deadline = time.monotonic() + WRITE_BATCH_TIMEOUT
+        while len(rows) < WRITE_BATCH_SIZE:
+            try:
+                rows.append(_WRITE_Q.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        try:
+            _execute_many(_STMT_REGISTER_MEASUREMENT, rows)
+            _check_for_existing_measurements.cache_clear()
+        # Keep the thread alive for any error, including SystemExit from _connect(); flush_measurements() re-raises it
+        # pylint: disable=broad-except
+        except BaseException as e:
+            logger.error('Cannot serialize %s measurements: %s', len(rows), e)
+            _WRITER_ERRORS.put(e)
+        finally:
+            for _ in rows:
+                _WRITE_Q.task_done()
+
+
+def _start_measurement_writer():
+    global _WRITER
+    with _WRITER_LOCK:
+        if _WRITER is None:
+            _WRITER = threading.Thread(target=_measurement_writer, name='measurement-writer', daemon=True)
+            _WRITER.start()
+            atexit.register(flush_measurements)
+
+
+def flush_measurements():
+    """Block until all queued measurements are written; re-raises the first error the writer ran into since the last flush"""
+    if _WRITER is not None and not _WRITER.is_alive():
+        raise RuntimeError(f'The measurement writer thread stopped, {_WRITE_Q.qsize()} measurements were not written')
+    _WRITE_Q.join()
+    errors = []
+    while not _WRITER_ERRORS.empty():
+        errors.append(_WRITER_ERRORS.get())
+    if len(errors) > 0:
+        raise errors[0]
 
 
 def register_measurement(query_path, disabled_rules, walltime, input_data_size, nodes):
-    logger.info('Serialize a new measurement for query %s and the disabled knobs [%s]', query_path, disabled_rules)
-    with _db() as conn:
-        now = datetime.now()
-        query = """
-                INSERT INTO measurements (query_optimizer_config_id, walltime, machine, time, input_data_size, num_compute_nodes)
-                SELECT id, :walltime, :host, :time, :input_data_size, :nodes FROM query_optimizer_configs 
-                WHERE query_id = (SELECT id FROM queries WHERE query_path = :query_path) AND disabled_rules = :disabled_rules 
-                """
-        conn.execute(query, walltime=walltime, host=socket.gethostname(), time=now.strftime('%m/%d/%y, %h:%m:%s'), input_data_size=input_data_size, nodes=nodes,
-                     query_path=query_path, disabled_rules=str(disabled_rules))
+    register_measurements([{'query_path': query_path, 'disabled_rules': disabled_rules, 'walltime': walltime,
+                            'input_data_size': input_data_size, 'nodes': nodes}])
 
 
 def median_runtimes():
+    """Yield the median runtime of every optimizer configuration; the median is computed by SQLite"""
+    flush_measurements()
     class OptimizerConfigResult:
         def __init__(self, path, num_disabled_rules, disabled_rules, json_plan, runtime):
             self.path = path
@@ -258,18 +448,15 @@ def median_runtimes():
             self.json_plan = json_plan
             self.runtime = runtime
 
-    with _db() as conn:
-        default_plans_stmt = """SELECT q.query_path, qoc.num_disabled_rules, qoc.disabled_rules, logical_plan_json, elapsed
-        FROM queries q,  query_optimizer_configs qoc, measurements m
-        WHERE q.id = qoc.query_id AND qoc.id = m.query_optimizer_config_id
-        """
-        df = pd.read_sql(default_plans_stmt, conn)
-        default_median_runtimes = df.groupby(['query_path', 'num_disabled_rules', 'disabled_rules', 'logical_plan_json'])['elapsed'].median().reset_index()
-
-        return [OptimizerConfigResult(*row) for index, row in default_median_runtimes.iterrows()]
+    with _engine().connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=STREAM_ROW_BUFFER).execute(_STMT_MEDIAN_RUNTIMES)
+        for row in result:
+            yield OptimizerConfigResult(*row)
 
 
 def best_alternative_configuration(benchmark=None):
+    """Yield the best alternative optimizer configuration per query of the benchmark directory, or of all queries if None"""
+    flush_measurements()
     class OptimizerConfigResult:
         def __init__(self, path, num_disabled_rules, runtime, runtime_baseline, savings, disabled_rules, rank):
             self.path = path
@@ -280,27 +467,87 @@ def best_alternative_configuration(benchmark=None):
             self.disabled_rules = disabled_rules
             self.rank = rank
 
-    stmt = read_sql_file('best_alternative_queries.sql')
-
-    with _db() as conn:
-        cursor = conn.execute(stmt, path=benchmark)
-        return [OptimizerConfigResult(*row) for row in cursor.fetchall()]
+    with _engine().connect() as conn:
+        stmt = _STMT_BEST_ALTERNATIVE_CONFIGURATION[benchmark is not None]
+        result = conn.execution_options(stream_results=True, max_row_buffer=STREAM_ROW_BUFFER).execute(stmt, benchmark=_benchmark(benchmark))
+        for row in result:
+            yield OptimizerConfigResult(*row)
 
 
 class TestStorage(unittest.TestCase):
     """Test the storage class"""
 
     def test_median(self):
-        with _db() as db:
+        with _engine().connect() as db:
             result = db.execute('SELECT MEDIAN(a) FROM (SELECT 1 AS a) AS tab').fetchall()
             assert len(result) == 1
 
     def test_queries(self):
-        with _db() as db:
+        with _engine().connect() as db:
             result = db.execute('SELECT * FROM queries').fetchall()
             print(result)
 
     def test_optimizers(self):
-        with _db() as db:
+        with _engine().connect() as db:
             result = db.execute('SELECT * FROM query_effective_optimizers;')
             print(result.fetchall())
+
+    def test_journal_mode(self):
+        with _engine().connect() as db:
+            result = db.execute('PRAGMA journal_mode').fetchone()
+            assert result[0] == 'wal'
+
+    def _register_test_query(self):
+        """Register a query of a fresh benchmark directory so that tests do not see each other's rows"""
+        global BENCHMARK_ID
+        benchmark = f'test/benchmark_{time.time_ns()}'
+        BENCHMARK_ID = register_benchmark(benchmark)
+        query_path = f'{benchmark}/1.sql'
+        register_query(query_path)
+        return benchmark, query_path
+
+    def test_measurements_are_visible_after_flush(self):
+        benchmark, query_path = self._register_test_query()
+        register_query_config(query_path, None, 'default plan', 1)
+        register_query_config(query_path, 'knob_a', 'alternative plan', 2)
+        assert not check_for_existing_measurements(query_path, 'knob_a')
+
+        for walltime in [100, 120, 110]:
+            register_measurement(query_path, None, walltime=walltime, input_data_size=0, nodes=1)
+        register_measurement(query_path, 'knob_a', walltime=55, input_data_size=0, nodes=1)
+
+        # the read helpers flush the queued measurements first
+        assert check_for_existing_measurements(query_path, 'None')
+        assert check_for_existing_measurements(query_path, 'knob_a')
+        result = list(best_alternative_configuration(benchmark))
+        assert len(result) == 1
+        assert result[0].disabled_rules == 'knob_a'
+        assert result[0].runtime_baseline == 110
+        assert result[0].savings == 0.5
+
+    def test_register_query_config_keeps_existing_row(self):
+        _, query_path = self._register_test_query()
+        assert not register_query_config(query_path, 'knob_a', 'plan', 1)
+        assert register_query_config(query_path, 'knob_b', 'plan', 1)
+        assert register_query_config(query_path, 'knob_a', 'plan', 1)  # knob_b produced the same plan meanwhile
+
+        with _engine().connect() as db:
+            rows = db.execute(text('SELECT qoc.id, qoc.disabled_rules, qoc.duplicated_plan FROM query_optimizer_configs qoc, queries q '
+                                   'WHERE q.id = qoc.query_id AND q.query_path = :query_path ORDER BY qoc.id'), query_path=query_path).fetchall()
+        assert [(row[1], row[2]) for row in rows] == [('knob_a', 0), ('knob_b', 1)]
+        assert rows[1][0] == rows[0][0] + 1  # re-registering did not consume an id
+
+    def test_default_plan_runtime(self):
+        _, query_path = self._register_test_query()
+        register_query_config(query_path, None, 'default plan', 1)
+        for walltime in [100, 120, 110]:
+            register_measurement(query_path, None, walltime=walltime, input_data_size=0, nodes=1)
+        flush_measurements()
+
+        stmt = text('SELECT walltime FROM default_plan_runtime WHERE query_path = :query_path')
+        with _engine().begin() as db:
+            assert db.execute(stmt, query_path=query_path).scalar() == 110
+            db.execute(text('DELETE FROM measurements WHERE walltime = 120 AND query_optimizer_config_id IN '
+                            '(SELECT qoc.id FROM query_optimizer_configs qoc, queries q WHERE q.id = qoc.query_id AND q.query_path = :query_path)'),
+                       query_path=query_path)
+            assert db.execute(stmt, query_path=query_path).scalar() == 105
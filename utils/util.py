@@ -6,14 +6,16 @@
 import operator
 from functools import reduce
 import hashlib
+import re
+
+COMMENT_LINE = re.compile(r'^--[^\n]*', re.MULTILINE)
 
 
 def read_sql_file(filename, encoding='utf-8') -> str:
     """Read SQL file, remove comments, and return a list of sql statements as a string"""
     with open(filename, encoding=encoding) as f:
         file = f.read()
-    statements = file.split('\n')
-    return '\n'.join(filter(lambda line: not line.startswith('--'), statements))
+    return COMMENT_LINE.sub('', file)
 
 
 def hash_sql_result(s):